@@ -0,0 +1,8 @@
+"""
+Benchmarks of the transcripter and the scenario engine:
+
+    $ python -m benchmarks engine --states 1000 --fanout 8 --save before.json
+    $ python -m benchmarks engine --states 1000 --fanout 8 --save after.json
+    $ python -m benchmarks compare before.json after.json
+    $ python -m benchmarks load --url http://localhost:5000/ --states 1000
+"""
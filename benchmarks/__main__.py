@@ -0,0 +1,63 @@
+import argparse
+
+from . import engine, load, results
+from .generator import generate_script
+
+
+def _add_scenario_arguments(parser):
+    parser.add_argument('--states', type=int, default=100)
+    parser.add_argument('--fanout', type=int, default=4)
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help='write the results to this file')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m benchmarks')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    engine_parser = commands.add_parser('engine',
+        help='time the transcripter and Scenario.action')
+    _add_scenario_arguments(engine_parser)
+
+    load_parser = commands.add_parser('load',
+        help='send generated requests to a running simplethoth.app')
+    load_parser.add_argument('--url', default='http://localhost:5000/')
+    load_parser.add_argument('--concurrency', type=int, default=8)
+    _add_scenario_arguments(load_parser)
+
+    compare_parser = commands.add_parser('compare',
+        help='compare two saved results')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+
+    generate_parser = commands.add_parser('generate',
+        help='write a synthetic script, e.g. to serve it for `load`')
+    generate_parser.add_argument('output')
+    generate_parser.add_argument('--states', type=int, default=100)
+    generate_parser.add_argument('--fanout', type=int, default=4)
+    generate_parser.add_argument('--depth', type=int, default=2)
+    generate_parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        for line in results.compare(results.load(args.old), results.load(args.new)):
+            print(line)
+    elif args.command == 'generate':
+        with open(args.output, 'w', encoding='utf-8') as fp:
+            fp.writelines(generate_script(args.states, args.fanout, args.depth, args.seed))
+    else:
+        if args.command == 'engine':
+            run_results = engine.run(args.states, args.fanout, args.depth,
+                args.requests, args.seed)
+        else:
+            run_results = load.run(args.url, args.requests, args.concurrency,
+                args.states, args.fanout, args.depth, args.seed)
+
+        for result in run_results:
+            print(results.format_result(result))
+        if args.save:
+            results.save(run_results, args.save)
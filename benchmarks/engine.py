@@ -0,0 +1,61 @@
+import json
+import os
+import tempfile
+import time
+
+from simplethoth.scenario import Scenario
+from simplethoth.transcript import transcripter
+
+from .generator import generate_requests, generate_script
+from .results import summarize
+
+
+def bench_transcript(lines, repeat=3):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        transcripter.transcript(lines)
+        latencies.append(time.perf_counter() - started)
+    return summarize('transcript', latencies, sum(latencies),
+        lines=len(lines), repeat=repeat)
+
+
+def bench_action(scenario, requests):
+    latencies = []
+    started = time.perf_counter()
+    for req in requests:
+        request_started = time.perf_counter()
+        scenario.action(req['context'], req['msg'])
+        latencies.append(time.perf_counter() - request_started)
+    elapsed = time.perf_counter() - started
+    return summarize('action', latencies, elapsed, requests=len(requests))
+
+
+def bench_load(path):
+    started = time.perf_counter()
+    Scenario(path)
+    elapsed = time.perf_counter() - started
+    return summarize('scenario_load', [elapsed], elapsed)
+
+
+def run(states=100, fanout=4, depth=2, requests=10000, seed=0):
+    """
+    Generates a script, then times its transcription, loading the
+    resulting scenario and evaluating `requests` requests against it.
+    """
+    lines = generate_script(states, fanout, depth, seed)
+    results = [bench_transcript(lines)]
+
+    scenario = transcripter.transcript(lines)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'scenario.json')
+        with open(path, 'w', encoding='utf-8') as fp:
+            json.dump(scenario, fp, ensure_ascii=False)
+
+        results.append(bench_load(path))
+        reqs = generate_requests(requests, states, fanout, depth, seed)
+        results.append(bench_action(Scenario(path), reqs))
+
+    for result in results:
+        result['params'].update(states=states, fanout=fanout, depth=depth)
+    return results
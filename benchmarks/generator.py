@@ -0,0 +1,59 @@
+import random
+
+
+def _context_path(depth):
+    return [f'level{level}' for level in range(depth)] + ['name']
+
+
+def generate_script(states=100, fanout=4, depth=2, seed=0):
+    """
+    Returns the lines of a synthetic script with `states` states, each with
+    `fanout` quick replies, reading and writing context keys nested `depth`
+    levels deep.
+    """
+    rng = random.Random(seed)
+    key = '_'.join(_context_path(depth))
+    lines = []
+
+    for index in range(states):
+        lines.append(f'STATE S{index}')
+        lines.append(f'> Static message of state {index}.')
+        lines.append(f'> Hello {{{key}}}, you said {{msg}}.')
+        lines.append(f'IF {key} is "user{index}"')
+        lines.append(f'> Welcome back, user{index}.')
+        lines.append(f'SET context_{key} "user{index}"')
+
+        for reply in range(fanout):
+            lines.append(f'< Option {reply}')
+            lines.append(f'> You picked option {reply}.')
+            lines.append(f'GOTO S{rng.randrange(states)}')
+
+        lines.append(': Or type anything')
+
+    return [f'{line}\n' for line in lines]
+
+
+def generate_requests(count, states=100, fanout=4, depth=2, seed=0):
+    """
+    Returns `count` request objects (`{sess_id, context, msg}`) against the
+    scenario of `generate_script`; most of them pick a quick reply.
+    """
+    rng = random.Random(seed)
+    path = _context_path(depth)
+    requests = []
+
+    for sess_id in range(count):
+        state = rng.randrange(states)
+        context = {'Dialog': {'state': f'S{state}'}}
+        inner = context
+        for token in path[:-1]:
+            inner = inner.setdefault(token, {})
+        inner[path[-1]] = f'user{rng.randrange(states)}'
+
+        if rng.random() < 0.8:
+            msg = f'Option {rng.randrange(fanout)}'
+        else:
+            msg = 'free text'
+        requests.append({'sess_id': sess_id, 'context': context, 'msg': msg})
+
+    return requests
@@ -0,0 +1,43 @@
+"""
+HTTP load driver for a running `simplethoth.app`.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+import time
+import urllib.request
+
+from .generator import generate_requests
+from .results import summarize
+
+
+def _post(url, payload):
+    request = urllib.request.Request(url, data=json.dumps(payload).encode('utf-8'),
+        headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        response.read()
+
+
+def run(url, requests=1000, concurrency=8, states=100, fanout=4, depth=2, seed=0):
+    """
+    POSTs `requests` generated requests to `url` from `concurrency` threads.
+    """
+    reqs = generate_requests(requests, states, fanout, depth, seed)
+    latencies = []
+    lock = threading.Lock()
+
+    def send(req):
+        started = time.perf_counter()
+        _post(url, req)
+        latency = time.perf_counter() - started
+        with lock:
+            latencies.append(latency)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        for _ in executor.map(send, reqs):
+            pass
+    elapsed = time.perf_counter() - started
+
+    return [summarize('http', latencies, elapsed, url=url,
+        concurrency=concurrency, states=states, fanout=fanout, depth=depth)]
@@ -0,0 +1,73 @@
+import json
+import subprocess
+import time
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def summarize(name, latencies, elapsed, **params):
+    """
+    Builds a result from per-operation latencies and the total elapsed
+    time, both in seconds.
+    """
+    latencies = sorted(latencies)
+    return {
+        'name': name,
+        'params': params,
+        'ops': len(latencies),
+        'seconds': elapsed,
+        'throughput': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def format_result(result):
+    return (f"{result['name']:<24} {result['throughput']:>12.1f} ops/s"
+        f"  p50 {result['p50_ms']:8.3f} ms  p99 {result['p99_ms']:8.3f} ms")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            universal_newlines=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(results, path):
+    with open(path, 'w', encoding='utf-8') as fp:
+        json.dump({
+            'commit': _git_commit(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }, fp, indent=2)
+
+
+def load(path):
+    with open(path, encoding='utf-8') as fp:
+        return json.load(fp)
+
+
+def compare(old, new):
+    """
+    Returns a line per benchmark found in both runs, with the throughput
+    and latency of `new` relative to `old`.
+    """
+    old_results = {result['name']: result for result in old['results']}
+    lines = [f"{old.get('commit')} -> {new.get('commit')}"]
+    for result in new['results']:
+        base = old_results.get(result['name'])
+        if base is None:
+            continue
+
+        ratio = lambda key: result[key] / base[key] if base[key] else float('nan')
+        lines.append(f"{result['name']:<24} throughput x{ratio('throughput'):.2f}"
+            f"  p50 x{ratio('p50_ms'):.2f}  p99 x{ratio('p99_ms'):.2f}")
+    return lines
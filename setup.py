@@ -5,8 +5,11 @@ setup(
     version='0.1.5',
     author='Jeongmin Lee (Skile)',
     author_email='imleejm@gmail.com',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks']),
     url='https://github.com/GBS-Skile/SimpleThoth',
     python_requires='>=3',
     install_requires=['flask'],
+    extras_require={
+        'server': ['gunicorn', 'uvicorn'],
+    },
 )
\ No newline at end of file
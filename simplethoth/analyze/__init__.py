@@ -0,0 +1,50 @@
+"""
+Static analysis of transcripted scenarios: the state transition graph,
+targets naming no state, states no conversation can reach and groups of
+states no conversation can leave.
+"""
+from json import load
+
+from ..compiled import CompiledNodes, is_compiled
+from .graph import StateGraph
+
+
+def load_nodes(path, encoding='utf-8'):
+    """
+    Returns the state nodes of a JSON or compiled scenario, in order.
+    """
+    if is_compiled(path):
+        return [node for _, node in CompiledNodes(path).items()]
+
+    with open(path, encoding=encoding) as fp:
+        return load(fp)
+
+
+def default_roots(graph):
+    """
+    Conversations start in the fallback state, as new users have no
+    `Dialog.state`, or else in the first state of the scenario.
+    """
+    if None in graph.index:
+        return [None]
+    return graph.states[:1]
+
+
+def analyze(graph, roots=None):
+    """
+    Returns the problems found in `graph` as a dict of lists: `dangling`
+    and `dynamic` targets, `unreachable` states from `roots` (by default
+    `default_roots`), and `closed_cycles` of several states and
+    `dead_ends` conversations cannot leave to get back to a root.
+    """
+    if roots is None:
+        roots = default_roots(graph)
+
+    traps = graph.traps(roots)
+    return {
+        'dangling': graph.dangling,
+        'dynamic': graph.dynamic,
+        'unreachable': graph.unreachable(roots),
+        'closed_cycles': [trap for trap in traps if len(trap) > 1],
+        'dead_ends': [trap[0] for trap in traps if len(trap) == 1],
+    }
@@ -0,0 +1,44 @@
+import argparse
+import sys
+
+from . import StateGraph, analyze, load_nodes
+
+
+def _name(state):
+    return 'STATE?' if state is None else state
+
+
+def print_report(report):
+    for source, target in report['dangling']:
+        print(f'error: {_name(source)} jumps into undefined state {target!r}')
+    for source, target in report['dynamic']:
+        print(f'note: {_name(source)} jumps into {target!r}, only known at runtime')
+    for state in report['unreachable']:
+        print(f'warning: {_name(state)} is unreachable')
+    for cycle in report['closed_cycles']:
+        print(f'warning: no way out of {", ".join(map(_name, cycle))}')
+    for state in report['dead_ends']:
+        print(f'note: {_name(state)} never leaves itself')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m simplethoth.analyze')
+    parser.add_argument('scenario_file',
+        help='transcripted scenario, JSON or --compiled')
+    parser.add_argument('--entry', action='append', metavar='STATE',
+        help='state conversations start in, may be repeated '
+             '(default: STATE?, or else the first state)')
+    parser.add_argument('--graph', metavar='PATH',
+        help='write the adjacency index used by Scenario(graph=...)')
+    args = parser.parse_args()
+
+    graph = StateGraph.from_nodes(load_nodes(args.scenario_file))
+    report = analyze(graph, args.entry)
+    print_report(report)
+    print(f'{len(graph.states)} states, {len(graph.targets)} transitions, '
+          f'{len(report["dangling"])} errors.')
+
+    if args.graph:
+        graph.save(args.graph)
+
+    sys.exit(1 if report['dangling'] else 0)
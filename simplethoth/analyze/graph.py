@@ -0,0 +1,185 @@
+from collections import deque
+import heapq
+import json
+
+_MISSING = object()
+
+
+def _target(node):
+    """
+    Returns the `context.Dialog.state` set by `node`, or `_MISSING` if it
+    keeps the current state.
+    """
+    context = node.get('context')
+    if type(context) is not dict:
+        return _MISSING
+    dialog = context.get('Dialog')
+    if type(dialog) is not dict:
+        return _MISSING
+    return dialog.get('state', _MISSING)
+
+
+class StateGraph:
+    """
+    State transition graph in compressed sparse row form: the states which
+    can follow `states[i]` are `states[j]` for each `j` in
+    `targets[offsets[i]:offsets[i + 1]]`.
+
+    Built from the nodes, it also keeps the `dangling` targets (naming no
+    state, so the fallback state is served instead) and the `dynamic` ones
+    (templates, only known at runtime) as `(source, target)` pairs.
+    """
+    def __init__(self, states, offsets, targets):
+        self.states = states
+        self.offsets = offsets
+        self.targets = targets
+        self.index = {name: i for i, name in enumerate(states)}
+        self.dangling = []
+        self.dynamic = []
+
+    @classmethod
+    def from_nodes(cls, nodes):
+        # Later nodes of the same state win, as in `Scenario`.
+        nodes = list({node['state']: node for node in nodes}.values())
+        graph = cls([node['state'] for node in nodes], [0], [])
+        fallback = graph.index.get(None)
+
+        for i, node in enumerate(nodes):
+            edges = {}
+            for source in [node] + [branch.get('then', {}) for branch in node.get('branch', [])]:
+                target = _target(source)
+                if target is _MISSING:
+                    edges[i] = None
+                elif type(target) is str and '{' in target:
+                    graph.dynamic.append((node['state'], target))
+                elif target is not None and type(target) is not str \
+                        or target not in graph.index:
+                    graph.dangling.append((node['state'], target))
+                    if fallback is not None:
+                        edges[fallback] = None
+                else:
+                    edges[graph.index[target]] = None
+
+            graph.targets.extend(edges)
+            graph.offsets.append(len(graph.targets))
+
+        return graph
+
+    def successors(self, state):
+        i = self.index.get(state) if state is None or type(state) is str else None
+        if i is None:
+            return []
+        return [self.states[j] for j in self.targets[self.offsets[i]:self.offsets[i + 1]]]
+
+    def _successor_indices(self, i):
+        return self.targets[self.offsets[i]:self.offsets[i + 1]]
+
+    def unreachable(self, roots):
+        """
+        Returns the states which cannot be reached from any of `roots`.
+        """
+        seen = [False] * len(self.states)
+        queue = deque(self.index[root] for root in roots if root in self.index)
+        for i in queue:
+            seen[i] = True
+
+        while queue:
+            for j in self._successor_indices(queue.popleft()):
+                if not seen[j]:
+                    seen[j] = True
+                    queue.append(j)
+
+        return [name for name, reached in zip(self.states, seen) if not reached]
+
+    def components(self):
+        """
+        Yields the strongly connected components as lists of state indices,
+        using an iterative Tarjan's algorithm.
+        """
+        count = len(self.states)
+        order = [None] * count
+        low = [0] * count
+        on_stack = [False] * count
+        stack = []
+        counter = 0
+
+        for root in range(count):
+            if order[root] is not None:
+                continue
+
+            order[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            work = [(root, iter(self._successor_indices(root)))]
+
+            while work:
+                i, successors = work[-1]
+                for j in successors:
+                    if order[j] is None:
+                        order[j] = low[j] = counter
+                        counter += 1
+                        stack.append(j)
+                        on_stack[j] = True
+                        work.append((j, iter(self._successor_indices(j))))
+                        break
+                    elif on_stack[j]:
+                        low[i] = min(low[i], order[j])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[i])
+
+                    if low[i] == order[i]:
+                        component = []
+                        while True:
+                            j = stack.pop()
+                            on_stack[j] = False
+                            component.append(j)
+                            if j == i:
+                                break
+                        yield component
+
+    def traps(self, roots=()):
+        """
+        Returns the groups of states no transition leads out of, but for
+        those holding one of `roots` (the main loop of a scenario). A group
+        of one is a state which can only stay where it is. States with a
+        `dynamic` target may lead anywhere, so they are never trapped.
+        """
+        excluded = {self.index[source] for source, _ in self.dynamic}
+        excluded.update(self.index[root] for root in roots if root in self.index)
+        component_of = [0] * len(self.states)
+        components = list(self.components())
+        for number, component in enumerate(components):
+            for i in component:
+                component_of[i] = number
+
+        traps = []
+        for number, component in enumerate(components):
+            if not any(i in excluded for i in component) and all(component_of[j] == number
+                    for i in component for j in self._successor_indices(i)):
+                traps.append([self.states[i] for i in sorted(component)])
+        return traps
+
+    def most_targeted(self, limit):
+        """
+        Returns up to `limit` states with the most transitions into them.
+        """
+        in_degree = [0] * len(self.states)
+        for j in self.targets:
+            in_degree[j] += 1
+        best = heapq.nlargest(limit, range(len(self.states)), key=in_degree.__getitem__)
+        return [self.states[i] for i in best]
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as fp:
+            json.dump({'states': self.states, 'offsets': self.offsets,
+                'targets': self.targets}, fp, ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as fp:
+            data = json.load(fp)
+        return cls(data['states'], data['offsets'], data['targets'])
@@ -1,6 +1,13 @@
-from flask import Flask, jsonify, request
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, abort, jsonify, request
 import os
-from ..scenario import Scenario
+import threading
+import time
+from ..metrics import Metrics
+from ..session import open_session_store
+from ..utils.dict import deep_merge
+from .profiler import SamplingProfiler
+from .reloader import ScenarioReloader
 
 app = Flask(__name__)
 app.config.from_pyfile('config.cfg')
@@ -8,15 +15,193 @@ app.config.from_pyfile('config.cfg')
 scenario_path = os.environ.get('SCENARIO_PATH')
 if not scenario_path:
     raise FileNotFoundError('Please set SCENARIO_PATH environment variable')
-scenario = Scenario(scenario_path)
+
+# METRICS=1 records per-phase latency and state/branch hits, exposed on
+# /metrics, and enables the sampling profiler on /profiler/{start,stop}.
+metrics = Metrics() if os.environ.get('METRICS') else None
+profiler = SamplingProfiler()
+
+# With SCENARIO_GRAPH (written by `python -m simplethoth.analyze --graph`),
+# the states which may follow the one a response jumps into are compiled on a
+# background thread. Only compiled scenarios benefit. The file is reloaded
+# along with SCENARIO_PATH.
+warmer = ThreadPoolExecutor(max_workers=1)
+# Held while a warming job is queued or running. Requests arriving meanwhile
+# skip warming instead of queueing more jobs.
+_warming = threading.Lock()
+
+# SCENARIO_PATH is polled every SCENARIO_RELOAD_INTERVAL seconds; 0 disables
+# reloading. Up to RESPONSE_CACHE_SIZE rendered responses are memoized; 0
+# disables memoization.
+reloader = ScenarioReloader(
+    scenario_path, float(os.environ.get('SCENARIO_RELOAD_INTERVAL', 2.0)),
+    graph_path=os.environ.get('SCENARIO_GRAPH'), metrics=metrics,
+    response_cache_size=int(os.environ.get('RESPONSE_CACHE_SIZE', 10000)))
+
+if metrics is not None and reloader.scenario.responses is not None:
+    metrics.add_gauge('simplethoth_response_cache_hit_ratio',
+        'Hit ratio of the memoized responses of the current scenario.',
+        lambda: reloader.scenario.response_hit_rate)
+    metrics.add_gauge('simplethoth_response_cache_entries',
+        'Responses memoized by the current scenario.',
+        lambda: len(reloader.scenario.responses))
+
+# With SESSION_STORE (`memory` or `sqlite:PATH`), contexts are kept on the
+# server: clients may send only `sess_id` and `msg`, and the `context` of a
+# response is merged into the stored one.
+session_store_url = os.environ.get('SESSION_STORE')
+sessions = None
+if session_store_url:
+    sessions = open_session_store(session_store_url,
+        float(os.environ.get('SESSION_TTL', 86400)),
+        int(os.environ.get('SESSION_MAX', 100000)))
+
+# Batches of at least BATCH_POOL_THRESHOLD requests are evaluated on a pool
+# of BATCH_PROCESSES worker processes; 0 disables the pool.
+batch_processes = int(os.environ.get('BATCH_PROCESSES', 0))
+batch_pool_threshold = int(os.environ.get('BATCH_POOL_THRESHOLD', 256))
+_batch_pool = None
+_batch_pool_lock = threading.Lock()
+
+
+def timed(phase, fn, *args):
+    if metrics is None:
+        return fn(*args)
+
+    started = time.perf_counter()
+    result = fn(*args)
+    metrics.observe(phase, time.perf_counter() - started)
+    return result
+
+
+def get_scenario():
+    reloader.ensure_watching()
+    return reloader.scenario
+
+
+def get_batch_pool(scenario):
+    # Created lazily, so that each server worker forks its own pool, and
+    # recreated whenever the scenario is reloaded.
+    global _batch_pool
+    with _batch_pool_lock:
+        if _batch_pool is None or _batch_pool[0] is not scenario:
+            if _batch_pool is not None:
+                _batch_pool[1].close()
+            # Not while warming, lest the pool inherit a held cache lock.
+            with _warming:
+                _batch_pool = scenario, scenario.create_pool(batch_processes)
+        return _batch_pool[1]
+
+
+def _uses_session(req):
+    return sessions is not None and req.get('sess_id', None) is not None
+
+
+def load_context(req):
+    context = req.get('context', {})
+    if not _uses_session(req):
+        return context
+
+    return deep_merge(sessions.load(req['sess_id']), context)
+
+
+def save_context(req, context, res):
+    if _uses_session(req):
+        sessions.save(req['sess_id'], deep_merge(context, res['context']))
+    res['sess_id'] = req.get('sess_id', None)
+
+
+def next_state(context, res):
+    for ctx in (res['context'], context):
+        dialog = ctx.get('Dialog') if type(ctx) is dict else None
+        if type(dialog) is dict and 'state' in dialog:
+            return dialog['state']
+    return None
+
+
+def _warm(scenario, state):
+    try:
+        scenario.warm(state)
+    finally:
+        _warming.release()
+
+
+def warm_next_states(scenario, state):
+    if not scenario.cold_successors(state) or not _warming.acquire(blocking=False):
+        return
+
+    try:
+        warmer.submit(_warm, scenario, state)
+    except BaseException:
+        _warming.release()
+        raise
+
+
+def handle_request(req):
+    scenario = get_scenario()
+    context = load_context(req)
+    res = scenario.action(context, req.get('msg', ''))
+    save_context(req, context, res)
+    if scenario.graph is not None:
+        warm_next_states(scenario, next_state(context, res))
+    return res
+
+
+def handle_batch(reqs):
+    if sessions is not None:
+        sess_ids = [req['sess_id'] for req in reqs if _uses_session(req)]
+        if len(set(sess_ids)) < len(sess_ids):
+            # Later requests of a session depend on the earlier ones.
+            return [handle_request(req) for req in reqs]
+
+    scenario = get_scenario()
+    pool = None
+    if batch_processes and len(reqs) >= batch_pool_threshold:
+        pool = get_batch_pool(scenario)
+
+    contexts = [load_context(req) for req in reqs]
+    results = scenario.action_many([
+        {'context': context, 'msg': req.get('msg', '')}
+        for req, context in zip(reqs, contexts)
+    ], pool=pool)
+
+    for req, context, res in zip(reqs, contexts, results):
+        save_context(req, context, res)
+    return results
+
 
 @app.route('/', methods=['POST'])
 def run_scenario():
-    req = request.get_json()
+    req = timed('decode', request.get_json)
+    return timed('serialize', jsonify, handle_request(req))
 
-    res = scenario.action(req.get('context', {}), req.get('msg', ''))
-    res['sess_id'] = req.get('sess_id', None)
-    return jsonify(res)
+
+@app.route('/batch', methods=['POST'])
+def run_scenario_batch():
+    reqs = timed('decode', request.get_json)
+    return timed('serialize', jsonify, handle_batch(reqs))
+
+
+@app.route('/metrics')
+def export_metrics():
+    if metrics is None:
+        abort(404)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/profiler/start', methods=['POST'])
+def start_profiler():
+    if metrics is None:
+        abort(404)
+    started = profiler.start(float(request.args.get('interval', 0.005)))
+    return jsonify(started=started)
+
+
+@app.route('/profiler/stop', methods=['POST'])
+def stop_profiler():
+    if metrics is None:
+        abort(404)
+    return Response(profiler.stop(), mimetype='text/plain')
 
 
 if __name__ == '__main__':
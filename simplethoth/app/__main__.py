@@ -0,0 +1,26 @@
+import argparse
+import sys
+
+from gunicorn.app.wsgiapp import run
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m simplethoth.app')
+    parser.add_argument('-w', '--workers', type=int)
+    parser.add_argument('-b', '--bind')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+        help='serve the ASGI app with uvicorn workers')
+    args = parser.parse_args()
+
+    argv = ['gunicorn', '-c', 'python:simplethoth.app.gunicorn_conf']
+    if args.workers:
+        argv += ['--workers', str(args.workers)]
+    if args.bind:
+        argv += ['--bind', args.bind]
+    if args.use_async:
+        argv += ['--worker-class', 'uvicorn.workers.UvicornWorker', 'simplethoth.app.asgi:app']
+    else:
+        argv += ['simplethoth.app:app']
+
+    sys.argv = argv
+    run()
@@ -0,0 +1,110 @@
+"""
+ASGI variant of the routes of `simplethoth.app`, for async servers such as
+uvicorn:
+
+    $ uvicorn simplethoth.app.asgi:app
+
+Handlers block (batches may wait on a process pool, stopping the profiler
+joins its thread), so they run on the default executor of the event loop
+rather than on the loop itself.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from . import handle_batch, handle_request, metrics, profiler, timed
+
+
+async def _read_body(receive):
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def _send(send, status, body, content_type):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', content_type),
+            (b'content-length', str(len(body)).encode('ascii')),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_json(send, status, obj):
+    body = timed('serialize', json.dumps, obj).encode('utf-8')
+    await _send(send, status, body, b'application/json')
+
+
+async def _send_text(send, text, content_type=b'text/plain'):
+    await _send(send, 200, text.encode('utf-8'), content_type)
+
+
+async def _run_blocking(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def _run_json(handler, scope, receive, send):
+    try:
+        req = timed('decode', json.loads, await _read_body(receive))
+    except ValueError:
+        return await _send_json(send, 400, {'error': 'Bad Request'})
+
+    await _send_json(send, 200, await _run_blocking(handler, req))
+
+
+async def _export_metrics(scope, receive, send):
+    await _send_text(send, metrics.render(), b'text/plain; version=0.0.4')
+
+
+async def _start_profiler(scope, receive, send):
+    query = parse_qs(scope.get('query_string', b'').decode('ascii'))
+    started = profiler.start(float(query.get('interval', [0.005])[0]))
+    await _send_json(send, 200, {'started': started})
+
+
+async def _stop_profiler(scope, receive, send):
+    await _send_text(send, await _run_blocking(profiler.stop))
+
+
+_routes = {
+    '/': ('POST', lambda *args: _run_json(handle_request, *args)),
+    '/batch': ('POST', lambda *args: _run_json(handle_batch, *args)),
+}
+if metrics is not None:
+    _routes.update({
+        '/metrics': ('GET', _export_metrics),
+        '/profiler/start': ('POST', _start_profiler),
+        '/profiler/stop': ('POST', _stop_profiler),
+    })
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+
+    route = _routes.get(scope['path'])
+    if route is None:
+        return await _send_json(send, 404, {'error': 'Not Found'})
+
+    method, endpoint = route
+    if scope['method'] != method:
+        return await _send_json(send, 405, {'error': 'Method Not Allowed'})
+
+    await endpoint(scope, receive, send)
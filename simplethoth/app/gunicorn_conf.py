@@ -0,0 +1,29 @@
+"""
+Pre-fork serving configuration for gunicorn:
+
+    $ gunicorn -c python:simplethoth.app.gunicorn_conf simplethoth.app:app
+
+The app (and so the compiled `Scenario`) is loaded once in the master before
+forking, so every worker shares its pages copy-on-write.
+"""
+import gc
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WORKERS', multiprocessing.cpu_count()))
+worker_class = os.environ.get('WORKER_CLASS', 'sync')
+preload_app = True
+
+
+def pre_fork(server, worker):
+    # Keep the garbage collector from touching (and so copying) the pages
+    # of objects allocated while loading the scenario.
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # Catch up with changes made since the master loaded the scenario
+    # before serving, and start watching for later ones.
+    from simplethoth.app import reloader
+    reloader.ensure_watching()
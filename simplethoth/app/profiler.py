@@ -0,0 +1,52 @@
+import collections
+import sys
+import threading
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every other thread from a background thread, and
+    reports them in the collapsed format read by flamegraph tools.
+    """
+    def __init__(self):
+        self.samples = collections.Counter()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, interval=0.005):
+        if self.running:
+            return False
+
+        self.samples.clear()
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if self.running:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+        return self.report()
+
+    def _run(self, interval):
+        own_id = threading.get_ident()
+        while not self._stopped.wait(interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def report(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
@@ -0,0 +1,104 @@
+import logging
+import os
+import threading
+import time
+
+from ..analyze import StateGraph
+from ..scenario import Scenario
+
+logger = logging.getLogger(__name__)
+
+
+class ScenarioReloader:
+    """
+    Holds the `Scenario` being served and reloads it when its file changes.
+
+    The new scenario is built and compiled on a background thread and then
+    swapped in with a single assignment, so requests which already fetched
+    `scenario` finish on the old version. If loading fails, the old version
+    keeps serving. `scenario_kwargs` are passed to every `Scenario`.
+
+    The adjacency index at `graph_path` (see `simplethoth.analyze`), if any,
+    is reloaded along with the scenario. A scenario which changed while its
+    index did not is served without one until the index is written again.
+    """
+    def __init__(self, path, interval=2.0, graph_path=None, **scenario_kwargs):
+        self.path = path
+        self.interval = interval
+        self.graph_path = graph_path
+        self.scenario_kwargs = scenario_kwargs
+        self._signature = self._stat(path)
+        self._graph_signature = self._stat(graph_path)
+        graph = StateGraph.load(graph_path) if graph_path else None
+        self.scenario = Scenario(path, graph=graph, **scenario_kwargs)
+        self._watcher_pid = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stat(path):
+        if path is None:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _load_graph(self, scenario_changed, graph_changed):
+        if self._graph_signature is None:
+            return None
+        if scenario_changed and not graph_changed:
+            logger.warning('%s changed but %s did not; serving without it.',
+                self.path, self.graph_path)
+            return None
+
+        try:
+            return StateGraph.load(self.graph_path)
+        except Exception:
+            logger.exception('Failed to load %s; serving without it.', self.graph_path)
+            return None
+
+    def reload_if_changed(self):
+        signature = self._stat(self.path)
+        graph_signature = self._stat(self.graph_path)
+        scenario_changed = signature != self._signature
+        graph_changed = graph_signature != self._graph_signature
+        if signature is None or not (scenario_changed or graph_changed):
+            return False
+
+        self._signature = signature
+        self._graph_signature = graph_signature
+        try:
+            graph = self._load_graph(scenario_changed, graph_changed)
+            scenario = Scenario(self.path, graph=graph, **self.scenario_kwargs)
+        except Exception:
+            logger.exception('Failed to reload %s; keeping the old scenario.', self.path)
+            return False
+
+        self.scenario = scenario
+        logger.info('Reloaded %s.', self.path)
+        return True
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            self.reload_if_changed()
+
+    def ensure_watching(self):
+        """
+        Starts the watcher thread of the current process. Threads do not
+        survive `fork`, so this is called lazily from each server worker.
+
+        A worker forked after the file changed (a respawned one) starts
+        with the scenario loaded before forking, so the file is checked
+        once right away rather than after the first `interval`.
+        """
+        if not self.interval or self._watcher_pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._watcher_pid != os.getpid():
+                self.reload_if_changed()
+                thread = threading.Thread(target=self._watch, daemon=True)
+                thread.start()
+                self._watcher_pid = os.getpid()
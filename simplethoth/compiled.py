@@ -0,0 +1,262 @@
+"""
+Compact binary format of a scenario, opened with `mmap` and decoded one
+state node at a time.
+
+Layout (little endian):
+
+    header    magic, version, string count, state count and the offsets of
+              the string table and of the state index
+    nodes     state nodes, encoded with `_encode`
+    strings   every distinct string, UTF-8 encoded, then a table of
+              `string count + 1` offsets delimiting them
+    index     `(name id, node offset, node length)` for each state, sorted
+              by name (the fallback state, id -1, first)
+"""
+import mmap
+import os
+import struct
+
+MAGIC = b'STHC'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sHxxIIQQ')
+_INDEX_ENTRY = struct.Struct('<iQI')
+_OFFSET = struct.Struct('<Q')
+_U32 = struct.Struct('<I')
+_I64 = struct.Struct('<q')
+_F64 = struct.Struct('<d')
+
+_NONE, _TRUE, _FALSE, _INT, _BIGINT, _FLOAT, _STR, _LIST, _DICT = b'NTFIJDSLM'
+
+
+def is_compiled(path):
+    with open(path, 'rb') as fp:
+        return fp.read(len(MAGIC)) == MAGIC
+
+
+def _sort_key(name):
+    return (name is not None, name or '')
+
+
+class CompiledWriter:
+    """
+    Writes state nodes to a binary file object as they are added, so it can
+    consume `Transcripter.stream` directly.
+    """
+    def __init__(self, fp):
+        self.fp = fp
+        self.strings = {}
+        self.index = {}
+        self.fp.write(b'\0' * _HEADER.size)
+        self.position = _HEADER.size
+
+    def _string_id(self, value):
+        return self.strings.setdefault(value, len(self.strings))
+
+    def _encode(self, value, out):
+        if value is None:
+            out.append(_NONE)
+        elif value is True:
+            out.append(_TRUE)
+        elif value is False:
+            out.append(_FALSE)
+        elif type(value) is int:
+            if -2 ** 63 <= value < 2 ** 63:
+                out.append(_INT)
+                out += _I64.pack(value)
+            else:
+                out.append(_BIGINT)
+                out += _U32.pack(self._string_id(str(value)))
+        elif type(value) is float:
+            out.append(_FLOAT)
+            out += _F64.pack(value)
+        elif type(value) is str:
+            out.append(_STR)
+            out += _U32.pack(self._string_id(value))
+        elif type(value) is list:
+            out.append(_LIST)
+            out += _U32.pack(len(value))
+            for item in value:
+                self._encode(item, out)
+        elif type(value) is dict:
+            out.append(_DICT)
+            out += _U32.pack(len(value))
+            for key, item in value.items():
+                if type(key) is not str:
+                    raise ValueError(f'Key of a state node should be a string: {key!r}')
+                out += _U32.pack(self._string_id(key))
+                self._encode(item, out)
+        else:
+            raise ValueError(f'Cannot compile a value of type {type(value).__name__}.')
+
+    def add(self, node):
+        name = node['state']
+        if name is not None and type(name) is not str:
+            raise ValueError(f'State name should be a string: {name!r}')
+
+        out = bytearray()
+        self._encode(node, out)
+        name_id = -1 if name is None else self._string_id(name)
+        self.index[name] = (name_id, self.position, len(out))
+        self.fp.write(out)
+        self.position += len(out)
+
+    def close(self):
+        offsets = []
+        for value in self.strings:
+            offsets.append(self.position)
+            encoded = value.encode('utf-8')
+            self.fp.write(encoded)
+            self.position += len(encoded)
+        offsets.append(self.position)
+
+        strings_position = self.position
+        self.fp.write(b''.join(_OFFSET.pack(offset) for offset in offsets))
+        self.position += _OFFSET.size * len(offsets)
+
+        index_position = self.position
+        for name in sorted(self.index, key=_sort_key):
+            self.fp.write(_INDEX_ENTRY.pack(*self.index[name]))
+
+        self.fp.seek(0)
+        self.fp.write(_HEADER.pack(MAGIC, VERSION, len(self.strings),
+            len(self.index), strings_position, index_position))
+
+
+def write_compiled(nodes, path):
+    """
+    Writes `nodes` to `path`. Returns the number of distinct states.
+
+    The file is written aside and then replaced, never rewritten in place:
+    servers keep compiled scenarios memory-mapped, and truncating a mapped
+    file makes them crash on their next read.
+    """
+    tmp_path = f'{path}.tmp'
+    try:
+        with open(tmp_path, 'wb') as fp:
+            writer = CompiledWriter(fp)
+            for node in nodes:
+                writer.add(node)
+            writer.close()
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+    os.replace(tmp_path, path)
+    return len(writer.index)
+
+
+class CompiledNodes:
+    """
+    Read-only mapping from state name to state node over a compiled file.
+    Nothing but the header is read when opening; nodes are decoded on
+    every access, so callers should cache what they need.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as fp:
+            self._buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self._string_count, self._state_count, \
+            self._strings_position, self._index_position = _HEADER.unpack_from(self._buffer)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a compiled scenario of version {VERSION}.')
+
+    def __len__(self):
+        return self._state_count
+
+    def _string(self, string_id):
+        position = self._strings_position + string_id * _OFFSET.size
+        start, = _OFFSET.unpack_from(self._buffer, position)
+        end, = _OFFSET.unpack_from(self._buffer, position + _OFFSET.size)
+        return self._buffer[start:end].decode('utf-8')
+
+    def _entry(self, index):
+        return _INDEX_ENTRY.unpack_from(self._buffer,
+            self._index_position + index * _INDEX_ENTRY.size)
+
+    def _name(self, name_id):
+        return None if name_id < 0 else self._string(name_id)
+
+    def __iter__(self):
+        for index in range(self._state_count):
+            yield self._name(self._entry(index)[0])
+
+    def items(self):
+        """
+        Yields `(name, node)` pairs in the order the nodes were added.
+        """
+        entries = sorted((self._entry(index) for index in range(self._state_count)),
+            key=lambda entry: entry[1])
+        for name_id, position, _ in entries:
+            yield self._name(name_id), self._decode(position)[0]
+
+    def _find(self, name):
+        if name is not None and type(name) is not str:
+            return None
+
+        key = _sort_key(name)
+        low, high = 0, self._state_count
+        while low < high:
+            middle = (low + high) // 2
+            entry = self._entry(middle)
+            middle_key = _sort_key(self._name(entry[0]))
+            if middle_key == key:
+                return entry
+            elif middle_key < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+    def __getitem__(self, name):
+        entry = self._find(name)
+        if entry is None:
+            raise KeyError(name)
+        return self._decode(entry[1])[0]
+
+    def get(self, name, fallback=None):
+        entry = self._find(name)
+        return fallback if entry is None else self._decode(entry[1])[0]
+
+    def _decode(self, position):
+        buffer = self._buffer
+        tag = buffer[position]
+        position += 1
+
+        if tag == _NONE:
+            return None, position
+        elif tag == _TRUE:
+            return True, position
+        elif tag == _FALSE:
+            return False, position
+        elif tag == _INT:
+            return _I64.unpack_from(buffer, position)[0], position + _I64.size
+        elif tag == _BIGINT:
+            string_id, = _U32.unpack_from(buffer, position)
+            return int(self._string(string_id)), position + _U32.size
+        elif tag == _FLOAT:
+            return _F64.unpack_from(buffer, position)[0], position + _F64.size
+        elif tag == _STR:
+            string_id, = _U32.unpack_from(buffer, position)
+            return self._string(string_id), position + _U32.size
+
+        count, = _U32.unpack_from(buffer, position)
+        position += _U32.size
+        if tag == _LIST:
+            result = []
+            for _ in range(count):
+                item, position = self._decode(position)
+                result.append(item)
+            return result, position
+        elif tag == _DICT:
+            result = {}
+            for _ in range(count):
+                key_id, = _U32.unpack_from(buffer, position)
+                item, position = self._decode(position + _U32.size)
+                result[self._string(key_id)] = item
+            return result, position
+
+        raise ValueError(f'Corrupted compiled scenario: unknown tag {tag!r}')
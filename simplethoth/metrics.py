@@ -0,0 +1,162 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+With a pre-fork server every worker process keeps its own metrics, so each
+scrape reflects the worker which served it.
+"""
+from bisect import bisect_left
+import threading
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def get(self, *labels):
+        return self._values.get(labels, 0)
+
+    def collect(self):
+        """
+        Returns the values counted so far and starts over, for `merge`.
+        """
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for labels, value in values.items():
+                self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in self._values.items():
+                lines.append(f'{self.name}{_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                # One count per bucket, then +Inf, then the sum.
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def collect(self):
+        """
+        Returns the values observed so far and starts over, for `merge`.
+        """
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+    def merge(self, values):
+        with self._lock:
+            for labels, counts in values.items():
+                current = self._values.get(labels)
+                if current is None:
+                    self._values[labels] = list(counts)
+                else:
+                    self._values[labels] = [a + b for a, b in zip(current, counts)]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, counts in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    le = _labels(self.labelnames, labels, f'le="{bound}"')
+                    lines.append(f'{self.name}_bucket{le} {cumulative}')
+                label_text = _labels(self.labelnames, labels)
+                lines.append(f'{self.name}_sum{label_text} {counts[-1]}')
+                lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """
+    Reports the value returned by `fn` at each scrape.
+    """
+    def __init__(self, name, documentation, fn):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+
+    def render(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge',
+            f'{self.name} {self.fn()}']
+
+
+class Metrics:
+    """
+    Latency of each request phase (`decode`, `state_lookup`, `branch`,
+    `format`, `cached` for memoized responses, `serialize`), how often each
+    state and branch is hit, and any gauge added with `add_gauge`.
+    """
+    def __init__(self):
+        self.latency = Histogram('simplethoth_phase_seconds',
+            'Time spent in each phase of a request.', ('phase',))
+        self.state_hits = Counter('simplethoth_state_hits_total',
+            'Requests served by each state.', ('state',))
+        self.branch_matches = Counter('simplethoth_branch_matches_total',
+            'Responses produced by each branch of a state (`none` for the state itself).',
+            ('state', 'branch'))
+        self.gauges = []
+
+    def add_gauge(self, name, documentation, fn):
+        self.gauges.append(Gauge(name, documentation, fn))
+
+    def observe(self, phase, seconds):
+        self.latency.observe(seconds, phase)
+
+    def collect(self):
+        """
+        Returns the latency and hits recorded so far and starts over, so
+        that another process can `merge` them.
+        """
+        return self.latency.collect(), self.state_hits.collect(), self.branch_matches.collect()
+
+    def merge(self, collected):
+        for metric, values in zip((self.latency, self.state_hits, self.branch_matches), collected):
+            metric.merge(values)
+
+    def render(self):
+        lines = []
+        for metric in (self.latency, self.state_hits, self.branch_matches, *self.gauges):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
@@ -1,4 +1,13 @@
+from collections.abc import Hashable, Mapping
 from json import load
+import multiprocessing
+from string import Formatter
+import re
+import time
+
+from .compiled import CompiledNodes, is_compiled
+from .metrics import Metrics
+from .utils.lru import LRUCache
 
 
 def flatten_dictionary(d):
@@ -23,10 +32,78 @@ def map_all_value(obj, fn):
     }
 
 
+_MISSING = object()
+
+
+def _fresh(value):
+    """
+    Copies the dicts and lists of a memoized response, so that callers
+    modifying what `Scenario.action` returns do not change later ones.
+    """
+    if type(value) is dict:
+        return {key: _fresh(item) for key, item in value.items()}
+    if type(value) is list:
+        return [_fresh(item) for item in value]
+    return value
+
+
+class _FlattenedView(Mapping):
+    """
+    Read-only mapping over `ContextManager` which resolves only the keys
+    actually looked up, e.g. the fields referenced by a message template.
+    """
+    def __init__(self, req_context, kwargs):
+        self._req_context = req_context
+        self._kwargs = kwargs
+
+    def __getitem__(self, key):
+        value = self._req_context.lookup(key, self._kwargs)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __iter__(self):
+        return iter({**self._kwargs, **self._req_context.flattened})
+
+    def __len__(self):
+        return len({**self._kwargs, **self._req_context.flattened})
+
+
 class ContextManager:
+    """
+    Wraps the context of a single request. The context is treated as a
+    snapshot: its flattened form is built at most once, and only when a key
+    containing `_` has to be resolved.
+    """
     def __init__(self, context: dict = {}):
         self._context = context
+        self._flattened = None
     
+    @property
+    def flattened(self):
+        if self._flattened is None:
+            self._flattened = flatten_dictionary(self._context)
+        return self._flattened
+
+    def lookup(self, key, kwargs={}):
+        """
+        Same as `flatten_dictionary(context).get(key)` falling back to
+        `kwargs`, but returns `_MISSING` instead of raising or defaulting.
+        """
+        if isinstance(key, str) and '_' not in key:
+            # Flattened nested keys always contain `_`, so only a top-level
+            # non-dict value can shadow `kwargs` here.
+            value = self._context.get(key, _MISSING)
+            if value is not _MISSING and type(value) != dict:
+                return value
+        else:
+            value = self.flattened.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+        return kwargs.get(key, _MISSING)
+
+
     def get(self, key, fallback = None):
         result = self._context
         
@@ -39,53 +116,456 @@ class ContextManager:
         return result
     
     def format_message(self, message, **kwargs):
-        kwargs.update(flatten_dictionary(self._context))
-        return message.format(**kwargs)
+        try:
+            return message.format_map(_FlattenedView(self, kwargs))
+        except ValueError:
+            # `format_map` rejects positional fields; let `format` report
+            # the error exactly as before.
+            return message.format(**{**kwargs, **self.flattened})
     
+    def resolve(self, key, **kwargs):
+        value = self.lookup(key, kwargs)
+        return None if value is _MISSING else value
+
     def check(self, condition, **kwargs):
-        kwargs.update(flatten_dictionary(self._context))
+        return Condition(condition).evaluate(self, **kwargs)
+
+
+OPERATORS = {
+    'is': lambda value, operand: value == operand,
+    'exists': lambda value, operand: bool(value) == operand,
+}
+
+
+class Condition:
+    """
+    Only the first query of a condition is ever evaluated, so that query is
+    picked out once instead of walking the raw condition on every check.
+    """
+    def __init__(self, condition: dict):
+        self.key = self.operator = self.operand = None
+        self.always = True
+
         for key, query in condition.items():
-            value = kwargs.get(key, None)
             for operator, operand in query.items():
-                if operator == 'is':
-                    return value == operand
-                elif operator == 'exists':
-                    return bool(value) == operand
-                else:
-                    raise NotImplementedError(f'Unknown operator: `{operator}`')
-        
-        return True
+                self.key, self.operator, self.operand = key, operator, operand
+                self.always = False
+                break
+            if not self.always:
+                break
+
+        self._evaluate = OPERATORS.get(self.operator)
+
+    @property
+    def is_known(self):
+        return self.always or self._evaluate is not None
+
+    def evaluate(self, req_context: ContextManager, **kwargs):
+        if self.always:
+            return True
+
+        if self._evaluate is None:
+            raise NotImplementedError(f'Unknown operator: `{self.operator}`')
+
+        return self._evaluate(req_context.resolve(self.key, **kwargs), self.operand)
+
+
+_formatter = Formatter()
+
+
+def _parse_fields(source, fields):
+    """
+    Collects the root names of keyword fields in `source`, including those
+    nested in format specs. Returns whether `source` has any field at all.
+    """
+    has_field = False
+    for _, field_name, format_spec, _ in _formatter.parse(source):
+        if field_name is None:
+            continue
+
+        has_field = True
+        name = re.match(r'[^.\[]*', field_name).group()
+        if name and not name.isdigit():
+            fields.append(name)
+        if format_spec:
+            _parse_fields(format_spec, fields)
+
+    return has_field
+
+
+class Template:
+    """
+    A message string parsed once at load time. Constant strings are rendered
+    without formatting, and templated ones only fetch their own fields.
+    """
+    def __init__(self, source: str):
+        self.source = source
+        self.constant = None
+        self.fields = []
+
+        try:
+            if not _parse_fields(source, self.fields):
+                self.constant = ''.join(
+                    literal for literal, *_ in _formatter.parse(source))
+        except ValueError:
+            # Malformed; fail on render just like `str.format` would.
+            self.fields = None
+
+        if self.fields:
+            self.fields = list(dict.fromkeys(self.fields))
+
+    def render(self, req_context: ContextManager, **kwargs):
+        if self.constant is not None:
+            return self.constant
+
+        if self.fields is None:
+            return req_context.format_message(self.source, **kwargs)
+
+        values = {}
+        for name in self.fields:
+            value = req_context.lookup(name, kwargs)
+            if value is not _MISSING:
+                values[name] = value
+
+        return self.source.format(**values)
+
+
+def compile_template(value):
+    return Template(value) if isinstance(value, str) else value
+
+
+def _leaves(obj):
+    for value in obj.values():
+        if type(value) == dict:
+            yield from _leaves(value)
+        else:
+            yield value
+
+
+class CompiledNode:
+    """
+    Output part (`message`, `platform`, `context`) of a state node or a
+    branch, with every string compiled into a `Template`.
+    """
+    def __init__(self, node: dict, index=None, memoize=True):
+        self.source = node
+        self.index = index
+        self.message = [compile_template(m) for m in node.get('message', [])]
+        self.platform = map_all_value(node.get('platform', {}), compile_template)
+        self.context = map_all_value(node.get('context', {}), compile_template)
+
+        # Keys (including `msg`) the output depends on, or None if unknown,
+        # e.g. for a malformed template.
+        self.reads = []
+        templates = [*self.message, *_leaves(self.platform), *_leaves(self.context)]
+        for template in templates:
+            if isinstance(template, Template):
+                if template.fields is None \
+                        or template.constant is None and not template.fields:
+                    # Malformed or positional only; rendering always fails.
+                    self.reads = None
+                    break
+                self.reads.extend(template.fields)
+
+        # Output of a node reading nothing is rendered once and for all,
+        # unless responses are not memoized.
+        self.response = None
+        if self.reads is not None:
+            self.reads = list(dict.fromkeys(self.reads))
+            if not self.reads and memoize:
+                self.response = self.render(ContextManager({}), '')
+
+    def cache_key(self, req_context: ContextManager, message: str):
+        """
+        Returns what identifies the rendered output among all requests
+        reaching this node, or None if it cannot be memoized.
+        """
+        if self.reads is None:
+            return None
+
+        kwargs = {'msg': message}
+        key = []
+        for name in self.reads:
+            value = req_context.lookup(name, kwargs)
+            # Equal values may still format differently, e.g. 1 and True.
+            key.append(type(value))
+            key.append(repr(value) if type(value) is float else value)
+
+        key = tuple(key)
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def render(self, req_context: ContextManager, message: str):
+        render = lambda m: (m.render(req_context, msg=message) if isinstance(m, Template) else m)
+
+        return {
+            'msg': [render(m) for m in self.message],
+            'platform': map_all_value(self.platform, render),
+            'context': map_all_value(self.context, render),
+        }
+
+
+class StateMatcher:
+    """
+    Precompiled branch selection for a single state node.
+
+    The last matching branch wins. Branches conditioned on `msg is <title>`
+    (quick replies) are kept in a hash table, so only the remaining branches
+    placed after the matched quick reply need to be evaluated.
+    """
+    def __init__(self, node: dict, memoize=True):
+        self.state = node.get('state')
+        self.node = CompiledNode(node, memoize=memoize)
+        self.quick_replies = {}
+        self.branches = []
+        self.error = None
+
+        for index, branch in enumerate(node.get('branch', [])):
+            condition = Condition(branch.get('condition', {}))
+            then = CompiledNode(branch.get('then', {}), index, memoize)
+
+            if not condition.is_known:
+                self.error = self.error or f'Unknown operator: `{condition.operator}`'
+            elif condition.key == 'msg' and condition.operator == 'is' \
+                    and isinstance(condition.operand, Hashable):
+                self.quick_replies[condition.operand] = (index, then)
+            else:
+                self.branches.append((index, condition, then))
+
+    def match(self, req_context: ContextManager, message: str):
+        if self.error:
+            raise NotImplementedError(self.error)
+
+        hit = None
+        if self.quick_replies:
+            try:
+                hit = self.quick_replies.get(req_context.resolve('msg', msg=message))
+            except TypeError:  # unhashable value never equals a title
+                hit = None
+
+        lower_bound = hit[0] if hit else -1
+        for index, condition, then in reversed(self.branches):
+            if index < lower_bound:
+                break
+            if condition.evaluate(req_context, msg=message):
+                return then
+
+        return hit[1] if hit else self.node
+
+
+class LazyMatchers:
+    """
+    Compiles the state nodes of a compiled scenario file on first access,
+    keeping the most recently used matchers. Unknown states are looked up
+    again every time rather than cached, as clients choose `Dialog.state`
+    and could otherwise evict every real matcher.
+    """
+    def __init__(self, nodes: CompiledNodes, cache_size, memoize=True):
+        self.nodes = nodes
+        self.cache = LRUCache(cache_size)
+        self.memoize = memoize
+
+    def get(self, state, fallback=None):
+        matcher = self.cache.get(state, _MISSING)
+        if matcher is _MISSING:
+            node = self.nodes.get(state)
+            if node is None:
+                return fallback
+            matcher = self.cache.put(state, StateMatcher(node, self.memoize))
+
+        return matcher
+
+
+_worker_scenario = None
+
+
+def _init_worker(scenario):
+    global _worker_scenario
+    if scenario.metrics is not None:
+        # Recorded here, then collected and merged into the parent's.
+        scenario.metrics = Metrics()
+    _worker_scenario = scenario
+
+
+def _action_in_worker(req):
+    result = _worker_scenario.action(req.get('context', {}), req.get('msg', ''))
+    metrics = _worker_scenario.metrics
+    return result, None if metrics is None else metrics.collect()
 
 
 class Scenario:
-    def __init__(self, path, encoding='utf-8'):
-        with open(path, encoding=encoding) as fp:
-            self._data = load(fp)
-            self.state_nodes = {
-                node['state']: node
-                for node in self._data
-            }
+    def __init__(self, path, encoding='utf-8', cache_size=4096, metrics=None,
+            response_cache_size=10000, graph=None):
+        """
+        Loads a JSON scenario, compiling every state up front, or a compiled
+        one (see `simplethoth.compiled`), compiling states lazily and
+        keeping at most `cache_size` of them.
+
+        If `metrics` (see `simplethoth.metrics.Metrics`) is given, every
+        `action` records its timing and the state and branch it hit.
+
+        Responses of nodes reading no context are rendered once, and up to
+        `response_cache_size` other responses are memoized, keyed by the
+        matched node and the values of the keys it reads (see
+        `CompiledNode.reads`); 0 disables memoization. Memoized responses
+        are copied on every hit, so callers may modify what they get.
+
+        `graph` is the adjacency index of the scenario (see
+        `simplethoth.analyze.StateGraph`). With a compiled scenario, the
+        states most transitions lead into are compiled up front, and `warm`
+        compiles the states which may follow a given one.
+        """
+        self.metrics = metrics
+        self.graph = graph
+        self.responses = LRUCache(response_cache_size) if response_cache_size else None
+        self.constant_hits = 0
+        memoize = self.responses is not None
+        if is_compiled(path):
+            self.state_nodes = CompiledNodes(path)
             self.fallback_state = self.state_nodes.get(None, {})
+            self.matchers = LazyMatchers(self.state_nodes, cache_size, memoize)
+        else:
+            with open(path, encoding=encoding) as fp:
+                self._data = load(fp)
+                self.state_nodes = {
+                    node['state']: node
+                    for node in self._data
+                }
+                self.fallback_state = self.state_nodes.get(None, {})
+
+            self.matchers = {
+                state: StateMatcher(node, memoize)
+                for state, node in self.state_nodes.items()
+            }
+
+        self.fallback_matcher = self.matchers.get(None) or StateMatcher(self.fallback_state, memoize)
+
+        if graph is not None and isinstance(self.matchers, LazyMatchers):
+            for state in graph.most_targeted(cache_size // 2):
+                self.matchers.get(state)
+
+    def cold_successors(self, state):
+        """
+        Returns the states reachable from `state` in one transition which
+        `warm` would compile: none unless the scenario is compiled and has
+        a `graph`.
+        """
+        if self.graph is None or not isinstance(self.matchers, LazyMatchers):
+            return []
+        cache = self.matchers.cache
+        return [successor for successor in self.graph.successors(state)
+            if successor not in cache]
+
+    def warm(self, state):
+        """
+        Compiles the states reachable from `state` in one transition, so
+        that the next request of a conversation in `state` finds them.
+        """
+        for successor in self.cold_successors(state):
+            self.matchers.get(successor)
 
     def action(self, context: dict, message: str):
         """
         """
+        if self.metrics is not None:
+            return self._action_instrumented(context, message)
+
         req_context = ContextManager(context)
         state = req_context.get('Dialog.state')
-        state_node = self.state_nodes.get(state, self.fallback_state)
+        matcher = self.matchers.get(state, self.fallback_matcher)
 
-        current_node = state_node
-        format_message = lambda m: (req_context.format_message(m, msg=message) if isinstance(m, str) else m)
+        return self._respond(matcher, req_context, message)[1]
 
-        for branch in state_node.get('branch', []):
-            if req_context.check(branch.get('condition', {}), msg=message):
-                current_node = branch.get('then', {})
-        
-        return {
-            'msg': [
-                format_message(m)
-                for m in current_node.get('message', [])
-            ],
-            'platform': map_all_value(current_node.get('platform', {}), format_message),
-            'context': map_all_value(current_node.get('context', {}), format_message),
-        }
+    def _respond(self, matcher: StateMatcher, req_context: ContextManager, message: str):
+        """
+        Returns the index of the matched branch (None for the state itself)
+        and the response, memoized if possible.
+        """
+        metrics = self.metrics
+        if metrics is not None:
+            started = time.perf_counter()
+
+        current_node = matcher.match(req_context, message)
+        if metrics is not None:
+            matched = time.perf_counter()
+            metrics.observe('branch', matched - started)
+
+        response = key = None
+        if self.responses is not None:
+            if current_node.response is not None:
+                self.constant_hits += 1
+                response = current_node.response
+            else:
+                key = current_node.cache_key(req_context, message)
+
+        if key is not None:
+            key = (matcher.state, current_node.index) + key
+            response = self.responses.get(key)
+
+        if response is not None:
+            if metrics is not None:
+                metrics.observe('cached', time.perf_counter() - matched)
+            return current_node.index, _fresh(response)
+
+        response = current_node.render(req_context, message)
+        if metrics is not None:
+            metrics.observe('format', time.perf_counter() - matched)
+
+        if key is not None:
+            self.responses.put(key, _fresh(response))
+        return current_node.index, response
+
+    def _action_instrumented(self, context: dict, message: str):
+        started = time.perf_counter()
+        req_context = ContextManager(context)
+        state = req_context.get('Dialog.state')
+        matcher = self.matchers.get(state, self.fallback_matcher)
+
+        metrics = self.metrics
+        metrics.observe('state_lookup', time.perf_counter() - started)
+        index, result = self._respond(matcher, req_context, message)
+
+        label = '' if matcher.state is None else matcher.state
+        metrics.state_hits.inc(label)
+        metrics.branch_matches.inc(label, 'none' if index is None else index)
+        return result
+
+    @property
+    def response_hit_rate(self):
+        if self.responses is None:
+            return 0.0
+
+        hits = self.constant_hits + self.responses.hits
+        total = hits + self.responses.misses
+        return hits / total if total else 0.0
+
+    def action_many(self, requests, *, pool=None, chunksize=64):
+        """
+        Runs `action` for each `{sess_id, context, msg}` object of `requests`
+        and returns the results in order. If `pool` (see `create_pool`) is
+        given, the requests are evaluated on its worker processes, which
+        send back what they recorded to `metrics`.
+        """
+        if pool is None:
+            return [
+                self.action(req.get('context', {}), req.get('msg', ''))
+                for req in requests
+            ]
+
+        results = []
+        for result, collected in pool.map(_action_in_worker, requests, chunksize):
+            if collected is not None and self.metrics is not None:
+                self.metrics.merge(collected)
+            results.append(result)
+        return results
+
+    def create_pool(self, processes=None):
+        """
+        Forks a pool of worker processes sharing this scenario, for
+        `action_many`.
+        """
+        return multiprocessing.get_context('fork').Pool(
+            processes, initializer=_init_worker, initargs=(self,))
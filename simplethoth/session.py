@@ -0,0 +1,119 @@
+"""
+Server-side storage of session contexts, keyed by `sess_id`.
+"""
+from collections import OrderedDict
+import copy
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class SessionStore:
+    """
+    `load` returns the context of a session (an empty dict for an unknown or
+    expired one), and `save` stores it back. Sessions not used for `ttl`
+    seconds expire.
+    """
+    def __init__(self, ttl=86400):
+        self.ttl = ttl
+
+    def load(self, sess_id):
+        raise NotImplementedError
+
+    def save(self, sess_id, context):
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Keeps at most `maxsize` sessions in this process, evicting the least
+    recently used. Only suits a single server process, as each worker would
+    keep sessions of its own.
+    """
+    def __init__(self, ttl=86400, maxsize=100000):
+        super().__init__(ttl)
+        self.maxsize = maxsize
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        # Least recently used first, so expired sessions are at the front.
+        while self._sessions:
+            sess_id, (expires, _) = next(iter(self._sessions.items()))
+            if expires > now and len(self._sessions) <= self.maxsize:
+                break
+            del self._sessions[sess_id]
+
+    def load(self, sess_id):
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._sessions.get(str(sess_id))
+            # A copy, so that only `save` changes the stored context.
+            return {} if entry is None else copy.deepcopy(entry[1])
+
+    def save(self, sess_id, context):
+        now = time.monotonic()
+        with self._lock:
+            self._sessions[str(sess_id)] = (now + self.ttl, context)
+            self._sessions.move_to_end(str(sess_id))
+            self._evict(now)
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    Keeps sessions in an SQLite database file, which every server process
+    on the host can share.
+    """
+    PURGE_INTERVAL = 1000
+
+    def __init__(self, path, ttl=86400):
+        super().__init__(ttl)
+        self.path = path
+        self._local = threading.local()
+        self._saves = 0
+        self._connection().execute('''
+            CREATE TABLE IF NOT EXISTS sessions (
+                sess_id TEXT PRIMARY KEY,
+                context TEXT NOT NULL,
+                expires REAL NOT NULL
+            )''')
+
+    def _connection(self):
+        # sqlite3 connections can cross neither threads nor `fork`.
+        if getattr(self._local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return self._local.connection
+
+    def load(self, sess_id):
+        row = self._connection().execute(
+            'SELECT context FROM sessions WHERE sess_id = ? AND expires > ?',
+            (str(sess_id), time.time())).fetchone()
+        return {} if row is None else json.loads(row[0])
+
+    def save(self, sess_id, context):
+        now = time.time()
+        connection = self._connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO sessions (sess_id, context, expires) VALUES (?, ?, ?)',
+            (str(sess_id), json.dumps(context, ensure_ascii=False), now + self.ttl))
+
+        self._saves += 1
+        if self._saves % self.PURGE_INTERVAL == 0:
+            connection.execute('DELETE FROM sessions WHERE expires <= ?', (now,))
+
+
+def open_session_store(url, ttl=86400, maxsize=100000):
+    """
+    Returns the store described by `url`: `memory` or `sqlite:PATH`.
+    """
+    if url == 'memory':
+        return MemorySessionStore(ttl, maxsize)
+    elif url.startswith('sqlite:'):
+        return SQLiteSessionStore(url[len('sqlite:'):], ttl)
+
+    raise ValueError(f'Unknown session store: `{url}`')
@@ -1,17 +1,111 @@
+import argparse
 import json
-import sys
+import os
 
 from . import transcripter
+from ..compiled import write_compiled
+from .errors import ParseError
+from .incremental import BlockCache, transcript_incremental
+from .parallel import transcript_files
+
+
+def dump_stream(nodes, fp):
+    """
+    Writes `nodes` exactly like `json.dump(list(nodes), fp, indent=2)`
+    without holding the whole list in memory. Returns the number of nodes.
+    """
+    count = 0
+    for node in nodes:
+        encoded = json.dumps(node, ensure_ascii=False, indent=2)
+        fp.write('[\n  ' if count == 0 else ',\n  ')
+        fp.write(encoded.replace('\n', '\n  '))
+        count += 1
+
+    fp.write('\n]' if count else '[]')
+    return count
+
+
+def write_scenario(scenario, output_path, compiled=False):
+    if compiled:
+        write_compiled(scenario, output_path)
+    else:
+        with open(output_path, 'w', encoding='utf-8') as f_out:
+            json.dump(scenario, f_out, ensure_ascii=False, indent=2)
+
+
+def transcript_stream(input_path, output_path, compiled=False):
+    tmp_path = f'{output_path}.tmp'
+    try:
+        with open(input_path, encoding='utf-8') as f_in:
+            if compiled:
+                count = write_compiled(transcripter.stream(f_in), tmp_path)
+            else:
+                with open(tmp_path, 'w', encoding='utf-8') as f_out:
+                    count = dump_stream(transcripter.stream(f_in), f_out)
+    except ParseError as e:
+        print(f"ParseError on line {e.lineno}: {str(e)}")
+        count = 0
+
+    if count:
+        os.replace(tmp_path, output_path)
+    else:
+        os.remove(tmp_path)
+
+
+def transcript_cached(input_path, output_path, cache_path, compiled=False):
+    cache = BlockCache(cache_path)
+    try:
+        with open(input_path, encoding='utf-8') as f_in:
+            scenario = transcript_incremental(f_in, cache)
+    except ParseError as e:
+        print(f"ParseError on line {e.lineno}: {str(e)}")
+        return
+
+    cache.save()
+    print(f'{cache.hits} blocks reused, {cache.misses} transcripted.')
+    if scenario:
+        write_scenario(scenario, output_path, compiled)
 
 
 if __name__ == '__main__':
-    if len(sys.argv) != 3:
-        print('Usage: python transcript.py <INPUT_FILE> <OUTPUT_FILE>')
+    parser = argparse.ArgumentParser(prog='python -m simplethoth.transcript')
+    parser.add_argument('input_files', nargs='+', metavar='input_file')
+    parser.add_argument('output_file')
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--stream', action='store_true',
+        help='write state nodes as soon as they are finished')
+    mode.add_argument('--incremental', action='store_true',
+        help='only transcript the STATE blocks changed since the last run')
+    parser.add_argument('--cache',
+        help='block cache of --incremental (default: OUTPUT_FILE.cache)')
+    parser.add_argument('--compiled', action='store_true',
+        help='write a compiled scenario instead of JSON')
+    parser.add_argument('-j', '--jobs', type=int,
+        help='processes parsing several input files (default: one per CPU)')
+    args = parser.parse_args()
+
+    if len(args.input_files) > 1:
+        if args.stream or args.incremental:
+            parser.error('--stream and --incremental take a single input file')
+
+        try:
+            scenario = transcript_files(args.input_files, args.jobs)
+        except ParseError as e:
+            where = '' if e.lineno is None else f' on line {e.lineno}'
+            print(f"ParseError{where}: {str(e)}")
+            scenario = None
+
+        if scenario:
+            write_scenario(scenario, args.output_file, args.compiled)
+    elif args.stream:
+        transcript_stream(args.input_files[0], args.output_file, args.compiled)
+    elif args.incremental:
+        transcript_cached(args.input_files[0], args.output_file,
+            args.cache or f'{args.output_file}.cache', args.compiled)
     else:
         scenario = None
-        with open(sys.argv[1], encoding='utf-8') as f_in:
+        with open(args.input_files[0], encoding='utf-8') as f_in:
             scenario = transcripter.transcript(f_in)
         
         if scenario:
-            with open(sys.argv[2], 'w', encoding='utf-8') as f_out:
-                json.dump(scenario, f_out, ensure_ascii=False, indent=2)
+            write_scenario(scenario, args.output_file, args.compiled)
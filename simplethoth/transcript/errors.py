@@ -1,7 +1,8 @@
 
 class ParseError(Exception):
-    def __init__(self, message):
+    def __init__(self, message, lineno=None):
         self.message = message
+        self.lineno = lineno
     
     def __str__(self):
         return self.message
\ No newline at end of file
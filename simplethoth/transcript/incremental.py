@@ -0,0 +1,165 @@
+"""
+Incremental transcription: a script is split into `STATE` blocks, and only
+the blocks whose source changed since the last run are transcribed again.
+The others are read from a cache keyed by the hash of their content.
+"""
+from collections import deque
+import hashlib
+import json
+import os
+
+from .errors import ParseError
+from .states import StateManager
+from .transcripter import _merge_before, transcripter
+
+CACHE_VERSION = 1
+STATE_COMMANDS = ('STATE', 'STATE?')
+
+
+class _BlockStateManager(StateManager):
+    """
+    Hands out the state names resolved over the whole script, so that a
+    block can be transcribed on its own.
+    """
+    def __init__(self, names):
+        super().__init__()
+        self._names = deque(names)
+
+    def get_valid_state_name(self):
+        return self._names[0]
+
+    def get_state(self, name):
+        self._names.popleft()
+        return dict(state=name)
+
+
+class BlockCache:
+    def __init__(self, path):
+        self.path = path
+        self.blocks = {}
+        self.hits = self.misses = 0
+        self._used = {}
+
+        try:
+            with open(path, encoding='utf-8') as fp:
+                data = json.load(fp)
+            if data.get('version') == CACHE_VERSION:
+                self.blocks = data['blocks']
+        except (OSError, ValueError):
+            pass
+
+    def get(self, key):
+        encoded = self.blocks.get(key)
+        if encoded is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._used[key] = encoded
+        return json.loads(encoded)
+
+    def put(self, key, node):
+        self._used[key] = json.dumps(node, ensure_ascii=False)
+
+    def save(self):
+        """
+        Writes the blocks used by the last run only, so the cache does not
+        grow with stale entries.
+        """
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fp:
+            json.dump({'version': CACHE_VERSION, 'blocks': self._used}, fp, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+
+def _split_blocks(lines):
+    """
+    Returns the lines before the first `STATE` and a list of
+    `(lineno, lines)` for each `STATE` block.
+    """
+    header, blocks = [], []
+    for lineno, line in enumerate(lines):
+        tokens = line.split(maxsplit=1)
+        if tokens and tokens[0] in STATE_COMMANDS:
+            blocks.append((lineno, [line]))
+        elif blocks:
+            blocks[-1][1].append(line)
+        else:
+            header.append(line)
+    return header, blocks
+
+
+def _resolve_names(blocks):
+    """
+    Resolves the state name of each block like `StateManager` does while
+    transcripting. A duplicated name is returned as the `ParseError` to
+    raise when its block is reached.
+    """
+    state_manager = StateManager()
+    names = []
+    for _, lines in blocks:
+        tokens = lines[0].split()
+        name = None
+        try:
+            if tokens[0] == 'STATE':
+                name = tokens[1] if len(tokens) > 1 else state_manager.get_valid_state_name()
+            state_manager.get_state(name)
+        except ParseError as e:
+            names.append(e)
+            continue
+        names.append(name)
+    return names
+
+
+def _block_key(lines, name, next_line, next_name):
+    # The next STATE line sets the jump target of this block if missing.
+    next_state = next_line is not None and next_line.split()[0] == 'STATE'
+    digest = hashlib.sha256(
+        json.dumps([CACHE_VERSION, name, next_state, next_name]).encode('utf-8'))
+    for line in lines:
+        digest.update(line.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _transcript_block(lineno, lines, name, next_line, next_name):
+    transcripter._reset(_BlockStateManager([name, next_name]))
+    for offset, line in enumerate(lines):
+        transcripter._invoke_line(lineno + offset, line)
+
+    if next_line is not None:
+        transcripter._invoke_line(lineno + len(lines), next_line)
+    return transcripter.scenario[0]
+
+
+def transcript_incremental(fp, cache: BlockCache):
+    """
+    Same as `Transcripter.transcript`, but reuses the blocks found in
+    `cache`. Raises `ParseError` on the first bad line.
+    """
+    header, blocks = _split_blocks(list(fp))
+    names = _resolve_names(blocks)
+
+    transcripter._reset()
+    for lineno, line in enumerate(header):
+        transcripter._invoke_line(lineno, line)
+
+    scenario = []
+    for index, (lineno, lines) in enumerate(blocks):
+        name = names[index]
+        if isinstance(name, ParseError):
+            name.lineno = lineno
+            raise name
+
+        next_line, next_name = None, None
+        if index + 1 < len(blocks) and not isinstance(names[index + 1], ParseError):
+            next_line, next_name = blocks[index + 1][1][0], names[index + 1]
+
+        key = _block_key(lines, name, next_line, next_name)
+        node = cache.get(key)
+        if node is None:
+            node = _transcript_block(lineno, lines, name, next_line, next_name)
+            cache.put(key, node)
+        scenario.append(node)
+
+    _merge_before(scenario)
+    return scenario
@@ -0,0 +1,71 @@
+"""
+Transcription of a project split into several independent script files.
+
+Each file is parsed on its own, in parallel on a process pool, as if it
+were the only script: its last state does not fall through to the first
+state of the next file. The parsed states are then merged into a single
+scenario, and `before` blocks are merged across files.
+
+States of an unnamed `STATE` are named after their file (`intro.0`,
+`intro.1`, ... for `intro.txt`), or after its path if several files share
+a name, so that they do not clash across files.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import os
+
+from .errors import ParseError
+from .states import StateManager
+from .transcripter import _merge_before, transcripter
+
+
+def _parse_file(path, prefix=''):
+    # Errors are returned rather than raised, as `ParseError` does not
+    # survive pickling with its line number.
+    try:
+        with open(path, encoding='utf-8') as fp:
+            return transcripter.parse(fp, StateManager(prefix)), None
+    except ParseError as e:
+        return None, (e.lineno, str(e))
+
+
+def _prefixes(paths):
+    if len(paths) < 2:
+        return ['']
+
+    names = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    if len(set(names)) < len(names):
+        names = paths
+    return [f'{name}.' for name in names]
+
+
+def transcript_files(paths, processes=None):
+    """
+    Returns the scenario made of every file of `paths`, parsed on up to
+    `processes` worker processes (in this process if 1). Raises `ParseError`
+    naming the file on the first bad line or on a state defined twice.
+    """
+    prefixes = _prefixes(paths)
+    if processes == 1 or len(paths) < 2:
+        parsed = [_parse_file(path, prefix) for path, prefix in zip(paths, prefixes)]
+    else:
+        with ProcessPoolExecutor(processes) as executor:
+            parsed = list(executor.map(_parse_file, paths, prefixes))
+
+    scenario = []
+    defined_in = {}
+    for path, (nodes, error) in zip(paths, parsed):
+        if error is not None:
+            lineno, message = error
+            raise ParseError(f'{path}: {message}', lineno)
+
+        for node in nodes:
+            name = node['state']
+            if name in defined_in:
+                command = 'STATE?' if name is None else f'STATE {name}'
+                raise ParseError(
+                    f'{path}: {command} already defined in {defined_in[name]}.')
+            defined_in[name] = path
+        scenario.extend(nodes)
+
+    _merge_before(scenario)
+    return scenario
@@ -1,15 +1,16 @@
 from .errors import ParseError
 
 class StateManager:
-    def __init__(self):
+    def __init__(self, prefix=''):
         self.names = set()
+        self.prefix = prefix
     
     def get_valid_state_name(self):
         index = len(self.names)
-        while str(index) in self.names:
+        while f'{self.prefix}{index}' in self.names:
             index += 1
         
-        return str(index)
+        return f'{self.prefix}{index}'
     
     def get_state(self, name):
         if name in self.names:
@@ -1,4 +1,7 @@
+from collections import deque
+from functools import lru_cache
 import ast
+import copy
 import json
 import sys
 
@@ -36,21 +39,174 @@ def _set_attribute(obj, path, value, *,
     if append and safe:
         raise ValueError("`append`, `safe` option cannot be together.")
 
-    tokens = path.split(sep)
-    for idx, token in enumerate(tokens):
-        if idx != len(tokens) - 1:
-            obj = obj.setdefault(token, {})
-        else:
-            if append:
-                obj.setdefault(token, []).append(value)
-            elif not safe:
-                obj[token] = value
-            else:
-                obj.setdefault(token, value)
+    *parents, token = path.split(sep)
+    for parent in parents:
+        obj = obj.setdefault(parent, {})
+
+    if append:
+        obj.setdefault(token, []).append(value)
+    elif not safe:
+        obj[token] = value
+    else:
+        obj.setdefault(token, value)
     
     return value
 
 
+_NO_TARGET = object()
+
+
+def _get_target(node):
+    """
+    Returns the state `node` jumps into (`context.Dialog.state`), or
+    `_NO_TARGET` if its context is not made of dicts.
+    """
+    try:
+        return _get_attribute(node, 'context.Dialog.state')
+    except (TypeError, AttributeError):
+        return _NO_TARGET
+
+
+class _NodeIndex:
+    """
+    Nodes grouped by the state they jump into (`context.Dialog.state`).
+    """
+    def __init__(self, nodes):
+        self._nodes = {}
+        self._unhashable = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        target = _get_target(node)
+        if target is _NO_TARGET:
+            return
+
+        try:
+            self._nodes.setdefault(target, []).append(node)
+        except TypeError:
+            self._unhashable.append((target, node))
+
+    def pop(self, state):
+        """
+        Removes and returns the nodes jumping into `state`. Callers `add`
+        them back once updated, as an update may change their target.
+        """
+        nodes = self._nodes.pop(state, [])
+        if self._unhashable:
+            nodes += [node for target, node in self._unhashable if target == state]
+            self._unhashable = [
+                (target, node) for target, node in self._unhashable
+                if target != state
+            ]
+        return nodes
+
+
+def _merge_before(scenario):
+    """
+    Applies the `before` block of each state to every node (state or
+    branch) that jumps into it, using an index from target state to nodes
+    built in a single pass.
+    """
+    if not any(node.get('before', None) for node in scenario):
+        return
+
+    nodes = [node for node in scenario]
+    for node in scenario:
+        nodes.extend([branch['then'] for branch in node.get('branch', [])])
+
+    index = _NodeIndex(nodes)
+    for state_node in scenario:
+        before = state_node.get('before', None)
+        if before:
+            del state_node['before']
+            items = _get_items(before).items()
+            for node in index.pop(state_node['state']):
+                for key, value in items:
+                    _set_attribute(node, key, value)
+                index.add(node)
+
+
+_TARGET_PATH = ['context', 'Dialog', 'state']
+
+
+def _affects_target(key):
+    tokens = key.split('.')[:len(_TARGET_PATH)]
+    return tokens == _TARGET_PATH[:len(tokens)]
+
+
+class _StreamMerger:
+    """
+    Incremental `_merge_before` for `Transcripter.stream`.
+
+    A state node is finished once its block is closed and every node in it
+    jumps into a state whose `before` block has already been merged. If a
+    `before` block may rewrite jump targets, its effect depends on the order
+    of every later state, so from then on all nodes are held back and merged
+    by `_merge_before` at the end.
+    """
+    def __init__(self):
+        self.queue = deque()
+        self.unresolved = {}
+        self.waiting = {}
+        self.befores = {}
+        self.held = False
+
+    def open(self, state_node):
+        self.queue.append(state_node)
+        self.unresolved[id(state_node)] = None
+
+    def close(self, state_node):
+        name = state_node['state']
+        before = state_node.get('before', None)
+        if not before:
+            self._resolve(name, ())
+        else:
+            items = _get_items(before).items()
+            if self.held or any(_affects_target(key) for key, _ in items):
+                self.held = True
+            else:
+                del state_node['before']
+                self._resolve(name, items)
+
+        unresolved = 0
+        nodes = [state_node] + [branch['then'] for branch in state_node.get('branch', [])]
+        for node in nodes:
+            target = _get_target(node)
+            if target is not None and type(target) is not str:
+                continue  # never equal to a state name
+
+            if target in self.befores:
+                for key, value in self.befores[target]:
+                    _set_attribute(node, key, value)
+            else:
+                self.waiting.setdefault(target, []).append((node, state_node))
+                unresolved += 1
+
+        self.unresolved[id(state_node)] = unresolved
+
+    def _resolve(self, name, items):
+        self.befores[name] = items
+        for node, owner in self.waiting.pop(name, []):
+            for key, value in items:
+                _set_attribute(node, key, value)
+            self.unresolved[id(owner)] -= 1
+
+    def pop_finished(self):
+        while self.queue and not self.held \
+                and self.unresolved[id(self.queue[0])] == 0:
+            state_node = self.queue.popleft()
+            del self.unresolved[id(state_node)]
+            yield state_node
+
+    def finish(self):
+        yield from self.pop_finished()
+
+        scenario = list(self.queue)
+        _merge_before(scenario)
+        yield from scenario
+
+
 class Transcripter:
     COMMENT_INDICATOR = '#'
 
@@ -64,64 +220,90 @@ class Transcripter:
             self.require_state = require_state
         
         def __call__(self, fn):
-            def __wrapper(*args, **kwargs):
-                if self.require_state and not self.transcripter.state:
-                    raise ParseError('Wrong command: STATE not defined.')
-
-                return fn(transcripter, *args, **kwargs)
-
-            self.transcripter._commands[self.name] = __wrapper
-            return __wrapper
+            self.transcripter._commands[self.name] = (fn, self.require_state)
+            return fn
     
     def command(self, name, *args, **kwargs):
         if name.startswith(self.COMMENT_INDICATOR):
             raise KeyError(f'The name of command should not start with `{self.COMMENT_INDICATOR}`.')
 
-        if name in self._commands.keys():
+        if name in self._commands:
             raise KeyError(f'Command {name} should be unique.')
 
         return self.Command(self, name, *args, **kwargs)
     
     def invoke_command(self, command, args):
-        if command in self._commands.keys():
-            return self._commands[command](*args)
+        try:
+            fn, require_state = self._commands[command]
+        except KeyError:
+            raise ParseError(f'Command {command} does not exist.') from None
+
+        if require_state and not self.state:
+            raise ParseError('Wrong command: STATE not defined.')
 
-        raise ParseError(f'Command {command} does not exist.')
+        return fn(self, *args)
     
-    def transcript(self, fp):
-        self.state_manager = StateManager()
+    def _reset(self, state_manager=None):
+        self.state_manager = state_manager or StateManager()
         self.scenario = []
         self.state = None
+        self.branch = None
+
+    def _invoke_line(self, lineno, line):
+        tokens = line.split()
+        if not tokens or tokens[0].startswith(self.COMMENT_INDICATOR):
+            return
 
+        try:
+            self.invoke_command(tokens[0], tokens[1:])
+        except ParseError as e:
+            e.lineno = lineno
+            raise
+
+    def parse(self, fp, state_manager=None):
+        """
+        Runs the commands of `fp` and returns the state nodes before their
+        `before` blocks are merged. Raises `ParseError` on the first bad line.
+        """
+        self._reset(state_manager)
         for lineno, line in enumerate(fp):
-            tokens = line.strip().split()
-            if len(tokens) == 0:
-                continue
-
-            if tokens[0].startswith(self.COMMENT_INDICATOR):
-                continue
-            
-            try:
-                self.invoke_command(tokens[0], tokens[1:])
-            except ParseError as e:
-                print(f"ParseError on line {lineno}: {str(e)}")
-                return
-        
-        for state_node in self.scenario:
-            before = state_node.get('before', None)
-            if before:
-                del state_node['before']
-                nodes = [node for node in self.scenario]
-                for node in self.scenario:
-                    nodes.extend([branch['then'] for branch in node.get('branch', [])])
-                
-                for node in nodes:
-                    if _get_attribute(node, 'context.Dialog.state') == state_node['state']:
-                        for key, value in _get_items(before).items():
-                            _set_attribute(node, key, value)
+            self._invoke_line(lineno, line)
+        return self.scenario
+
+    def transcript(self, fp):
+        try:
+            self.parse(fp)
+        except ParseError as e:
+            print(f"ParseError on line {e.lineno}: {str(e)}")
+            return
         
+        _merge_before(self.scenario)
         return self.scenario
-    
+
+    def stream(self, fp):
+        """
+        Same as `transcript`, but yields the state nodes in order as soon as
+        no later line can change them, instead of building the whole list.
+        Raises `ParseError` on the first bad line.
+        """
+        self._reset()
+        merger = _StreamMerger()
+
+        for lineno, line in enumerate(fp):
+            state = self.state
+            self._invoke_line(lineno, line)
+
+            if self.state is not state:
+                if state is not None:
+                    merger.close(state)
+                merger.open(self.state)
+                self.scenario.clear()
+                yield from merger.pop_finished()
+
+        if self.state is not None:
+            merger.close(self.state)
+        yield from merger.finish()
+
     @property
     def current(self):
         if self.branch is not None:
@@ -135,11 +317,27 @@ class Transcripter:
 transcripter = Transcripter()
 
 
+@lru_cache(maxsize=4096)
+def _cached_literal(source):
+    return ast.literal_eval(source)
+
+
+def _literal(source):
+    """
+    `ast.literal_eval`, memoized for operands repeated over a script.
+    Mutable results are copied, as commands like APPEND modify them.
+    """
+    value = _cached_literal(source)
+    if type(value) in (list, dict, set):
+        return copy.deepcopy(value)
+    return value
+
+
 @transcripter.command('IF')
 def cmd_set_branch(tr, variable, operator, *args):
     operand = ' '.join(args)
     tr.branch = tr.set_field('branch', {
-        'condition': { variable: { operator: ast.literal_eval(operand) } },
+        'condition': { variable: { operator: _literal(operand) } },
         'then': {}
     }, append=True)['then']
 
@@ -194,23 +392,23 @@ def cmd_add_message(tr, *args):
 
 @transcripter.command('GOTO')
 def cmd_add_next_state(tr, state_name):
-    # TODO State name verification
+    # The state may be defined later on; `python -m simplethoth.analyze`
+    # reports targets naming no state.
     tr.set_field('context.Dialog.state', state_name)
 
 
 @transcripter.command('GOTOSELF')
 def cmd_add_next_state(tr):
-    # TODO State name verification
     tr.set_field('context.Dialog.state', tr.state['state'])
 
 
 @transcripter.command('SET')
 def cmd_set_context(tr, path, *args):
-    value = ast.literal_eval(' '.join(args))
+    value = _literal(' '.join(args))
     tr.set_field(path, value, sep='_')
 
 
 @transcripter.command('APPEND')
 def cmd_set_context(tr, path, *args):
-    value = ast.literal_eval(' '.join(args))
+    value = _literal(' '.join(args))
     tr.set_field(path, value, sep='_', append=True)
@@ -0,0 +1,14 @@
+def deep_merge(base, delta):
+    """
+    Merges `delta` into `base` in place: nested dicts are merged, any other
+    value replaces the one in `base`. Dicts of `delta` are copied, never
+    shared with `base`.
+    """
+    for key, value in delta.items():
+        if type(value) == dict:
+            if type(base.get(key)) != dict:
+                base[key] = {}
+            deep_merge(base[key], value)
+        else:
+            base[key] = value
+    return base